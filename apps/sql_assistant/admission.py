@@ -0,0 +1,302 @@
+"""
+admission.py — Admission control for the ask service
+
+Requests are admitted in the event loop, before a threadpool thread is taken:
+a bounded number may be in flight, the rest wait in bounded per-priority
+queues (interactive before batch) without holding a thread. When a queue is
+full, a client is over its concurrency cap or a wait exceeds its timeout,
+`AdmissionRejected` is raised so the server can answer 429 with a Retry-After
+hint instead of letting requests pile up in the threadpool.
+
+Clients can be capped on concurrent requests. The cap is off by default
+because clients are told apart by the X-Client-Id header, and without it
+every caller behind the backend shares the backend's IP.
+
+Inside an admitted request, the two scarce resources in `ask_pipeline` (LLM
+calls and DB connections) are governed by slot pools. Those only order and
+delay work (again interactive first) and never reject. The in-flight bound
+caps how long they can wait, and a request that has already spent generation
+tokens is not turned away halfway through.
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterator
+
+PRIORITIES = ("interactive", "batch")  # highest first
+RESOURCES = ("llm", "db")
+# Threadpool threads kept for the other sync endpoints on top of admitted requests
+THREAD_HEADROOM = 8
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted; carries a Retry-After hint in seconds."""
+
+    def __init__(self, message: str, retry_after: int = 1) -> None:
+        super().__init__(message)
+        self.retry_after = max(1, int(retry_after))
+
+
+class _WaitStats:
+    def __init__(self) -> None:
+        self.served = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.hold_total = 0.0
+
+    def record_wait(self, waited: float) -> None:
+        self.served += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "served": self.served,
+            "wait_ms_avg": round(1000 * self.wait_total / self.served, 1) if self.served else 0.0,
+            "wait_ms_max": round(1000 * self.wait_max, 1),
+        }
+
+
+class RequestGate:
+    """Async in-flight limit with one bounded FIFO queue per priority class.
+
+    Must be used from the event loop; waiting requests hold no thread.
+    """
+
+    def __init__(self, capacity: int, queue_limits: Dict[str, int], timeout: float = 30.0) -> None:
+        self.capacity = capacity
+        self.queue_limits = queue_limits
+        self.timeout = timeout
+        self._in_flight = 0
+        self._queues: Dict[str, Deque["asyncio.Future[None]"]] = {p: deque() for p in PRIORITIES}
+        self._stats = _WaitStats()
+        self._rejected = 0
+
+    def _retry_after(self) -> int:
+        # Rough drain time of the current queue given the observed request duration
+        avg_hold = self._stats.hold_total / self._stats.served if self._stats.served else 1.0
+        queued = sum(len(q) for q in self._queues.values())
+        return math.ceil(avg_hold * (queued + 1) / max(1, self.capacity))
+
+    def _reject(self, message: str) -> AdmissionRejected:
+        self._rejected += 1
+        return AdmissionRejected(message, retry_after=self._retry_after())
+
+    def _wake(self) -> None:
+        # Hand free capacity to the oldest waiter of the highest priority
+        while self._in_flight < self.capacity:
+            waiter = next((q.popleft() for q in self._queues.values() if q), None)
+            if waiter is None:
+                return
+            if waiter.done():  # timed out or cancelled meanwhile
+                continue
+            self._in_flight += 1
+            waiter.set_result(None)
+
+    async def acquire(self, priority: str) -> float:
+        """Wait for an in-flight slot; returns the time spent waiting in seconds."""
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority class: {priority}")
+        if self._in_flight < self.capacity and not any(self._queues.values()):
+            self._in_flight += 1
+            self._stats.record_wait(0.0)
+            return 0.0
+
+        queue = self._queues[priority]
+        if len(queue) >= self.queue_limits.get(priority, 0):
+            raise self._reject(f"queue full for {priority} requests")
+
+        start = time.monotonic()
+        waiter: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.timeout)
+        except asyncio.TimeoutError:
+            if not waiter.done():
+                waiter.cancel()
+                queue.remove(waiter)
+                raise self._reject("timed out waiting for admission")
+            # Granted right at the deadline: keep the slot
+        except asyncio.CancelledError:
+            # Client went away; give the slot back if it was already granted
+            if waiter.done() and not waiter.cancelled():
+                self.release(0.0)
+            else:
+                waiter.cancel()
+                if waiter in queue:
+                    queue.remove(waiter)
+            raise
+        waited = time.monotonic() - start
+        self._stats.record_wait(waited)
+        return waited
+
+    def release(self, held: float) -> None:
+        self._in_flight -= 1
+        self._stats.hold_total += held
+        self._wake()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "capacity": self.capacity,
+            "in_flight": self._in_flight,
+            "queued": {p: len(q) for p, q in self._queues.items()},
+            "queue_limits": dict(self.queue_limits),
+            "rejected": self._rejected,
+            **self._stats.as_dict(),
+        }
+
+
+class SlotPool:
+    """Blocking counting semaphore that serves waiters by priority class, FIFO within a class."""
+
+    def __init__(self, name: str, capacity: int) -> None:
+        self.name = name
+        self.capacity = capacity
+        self._cond = threading.Condition()
+        self._in_use = 0
+        self._queues: Dict[str, Deque[object]] = {p: deque() for p in PRIORITIES}
+        self._stats = _WaitStats()
+
+    def _head(self) -> object:
+        for p in PRIORITIES:
+            if self._queues[p]:
+                return self._queues[p][0]
+        return None
+
+    def acquire(self, priority: str) -> float:
+        """Block until a slot is free; returns the time spent waiting in seconds."""
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority class: {priority}")
+        start = time.monotonic()
+        with self._cond:
+            ticket = object()
+            queue = self._queues[priority]
+            queue.append(ticket)
+            try:
+                while not (self._in_use < self.capacity and self._head() is ticket):
+                    self._cond.wait()
+            finally:
+                queue.remove(ticket)
+                # Whoever is now at the head may be able to proceed
+                self._cond.notify_all()
+            self._in_use += 1
+            waited = time.monotonic() - start
+            self._stats.record_wait(waited)
+            return waited
+
+    def release(self, held: float) -> None:
+        with self._cond:
+            self._in_use -= 1
+            self._stats.hold_total += held
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority: str) -> Iterator[float]:
+        waited = self.acquire(priority)
+        start = time.monotonic()
+        try:
+            yield waited
+        finally:
+            self.release(time.monotonic() - start)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "capacity": self.capacity,
+                "in_use": self._in_use,
+                "queued": {p: len(q) for p, q in self._queues.items()},
+                **self._stats.as_dict(),
+            }
+
+
+@dataclass
+class RequestTicket:
+    """Per-request handle: opens resource slots under the request's priority."""
+
+    controller: "AdmissionController"
+    client: str
+    priority: str
+    waits: Dict[str, float] = field(default_factory=dict)
+
+    @contextmanager
+    def gate(self, resource: str) -> Iterator[float]:
+        with self.controller.pools[resource].slot(self.priority) as waited:
+            self.waits[resource] = self.waits.get(resource, 0.0) + waited
+            yield waited
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        gate: RequestGate,
+        pools: Dict[str, int],
+        client_concurrency: int = 0,
+    ) -> None:
+        self.gate = gate
+        self.pools = {name: SlotPool(name, capacity) for name, capacity in pools.items()}
+        self.client_concurrency = client_concurrency
+        self._lock = threading.Lock()
+        self._clients: Dict[str, int] = {}
+        self._client_rejected = 0
+
+    def thread_tokens(self) -> int:
+        """Threadpool size that lets every admitted request run without queueing for a thread."""
+        return self.gate.capacity + THREAD_HEADROOM
+
+    @asynccontextmanager
+    async def admit(self, client: str, priority: str = "interactive") -> AsyncIterator[RequestTicket]:
+        """Admit one request for `client`; waits in the event loop, never in a thread."""
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority class: {priority}")
+        with self._lock:
+            active = self._clients.get(client, 0)
+            if self.client_concurrency > 0 and active >= self.client_concurrency:
+                self._client_rejected += 1
+                raise AdmissionRejected(f"too many concurrent requests for client {client}")
+            self._clients[client] = active + 1
+        try:
+            waited = await self.gate.acquire(priority)
+            start = time.monotonic()
+            try:
+                yield RequestTicket(self, client, priority, waits={"admission": waited})
+            finally:
+                self.gate.release(time.monotonic() - start)
+        finally:
+            with self._lock:
+                self._clients[client] -= 1
+                if not self._clients[client]:
+                    del self._clients[client]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            clients = {
+                "active": sum(self._clients.values()),
+                "distinct": len(self._clients),
+                "limit": self.client_concurrency,
+                "rejected": self._client_rejected,
+            }
+        return {
+            "requests": self.gate.stats(),
+            "pools": {name: pool.stats() for name, pool in self.pools.items()},
+            "clients": clients,
+        }
+
+
+def controller_from_env(env_int: Callable[[str, int], int]) -> AdmissionController:
+    """Build the controller from ASK_* environment variables (see README)."""
+    gate = RequestGate(
+        capacity=env_int("ASK_MAX_INFLIGHT", 16),
+        queue_limits={
+            "interactive": env_int("ASK_QUEUE_INTERACTIVE", 32),
+            "batch": env_int("ASK_QUEUE_BATCH", 8),
+        },
+        timeout=float(env_int("ASK_QUEUE_TIMEOUT", 30)),
+    )
+    pools = {"llm": env_int("ASK_LLM_SLOTS", 4), "db": env_int("ASK_DB_SLOTS", 8)}
+    return AdmissionController(gate, pools, client_concurrency=env_int("ASK_CLIENT_CONCURRENCY", 0))
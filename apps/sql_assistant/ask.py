@@ -8,9 +8,10 @@ Features
 - Introspects DB schema and passes a concise snapshot to the LLM
 - LLM produces a SINGLE safe, read-only SELECT query in JSON
 - Executes the SQL, then asks the LLM to summarize the results to answer the user’s question
+- Optional DB-side profiling (count, min/max/mean, nulls, top-k) when raw rows are not needed
 - Read-only safeguards (rejects DDL/DML; SQLite read-only mode; optional table whitelist)
 - Self-repair loop (retry invalid SQL with error feedback, up to N attempts)
-- CLI flags: --db, --model, --sql-only, --dry-run, --verbose, --max-rows, --repair-attempts, etc.
+- CLI flags: --db, --model, --sql-only, --dry-run, --verbose, --max-rows, --repair-attempts, --profile-only, etc.
 
 Usage
   export LLM_BASE_URL="http://nodo4:9000/v1"
@@ -32,18 +33,27 @@ Notes
 from __future__ import annotations
 
 import argparse
+import datetime as dt
 import json
 import os
 import re
 import sys
 import textwrap
-from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Tuple
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional, Tuple
 
 import pandas as pd
 from sqlalchemy import create_engine, text
 from sqlalchemy.engine import Engine
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import TimeoutError as PoolTimeout
 from sqlalchemy import inspect as sa_inspect
 
 try:
@@ -78,27 +88,105 @@ def llm_client(cfg: LLMConfig) -> OpenAI:
     return OpenAI(base_url=cfg.base_url, api_key=cfg.api_key)
 
 
+@dataclass
+class Trace:
+    """Per-request record of stage timings (seconds), LLM completions and repair attempts."""
+
+    timings: Dict[str, float] = field(default_factory=dict)
+    llm_calls: List[Dict[str, Any]] = field(default_factory=list)
+    repairs: List[Dict[str, Any]] = field(default_factory=list)
+    skipped: List[str] = field(default_factory=list)  # stages dropped by the token budget
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+    def record_llm(self, stage: str, resp: Any, latency: float) -> None:
+        usage = getattr(resp, "usage", None)
+        self.llm_calls.append(
+            {
+                "stage": stage,
+                "model": getattr(resp, "model", None),
+                "content": resp.choices[0].message.content,
+                "prompt_tokens": getattr(usage, "prompt_tokens", None),
+                "completion_tokens": getattr(usage, "completion_tokens", None),
+                "latency": round(latency, 4),
+            }
+        )
+
+    def total_tokens(self) -> int:
+        return sum((c["prompt_tokens"] or 0) + (c["completion_tokens"] or 0) for c in self.llm_calls)
+
+    def usage(self) -> Dict[str, Any]:
+        """Token/latency totals over all LLM calls, overall, per stage and per model."""
+        by_stage: Dict[str, Dict[str, Any]] = {}
+        by_model: Dict[str, Dict[str, Any]] = {}
+        for c in self.llm_calls:
+            for group in (by_stage.setdefault(c["stage"], {}), by_model.setdefault(c["model"] or "unknown", {})):
+                group["calls"] = group.get("calls", 0) + 1
+                group["prompt_tokens"] = group.get("prompt_tokens", 0) + (c["prompt_tokens"] or 0)
+                group["completion_tokens"] = group.get("completion_tokens", 0) + (c["completion_tokens"] or 0)
+                group["latency"] = round(group.get("latency", 0.0) + c["latency"], 4)
+        prompt = sum(s["prompt_tokens"] for s in by_stage.values())
+        completion = sum(s["completion_tokens"] for s in by_stage.values())
+        return {
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+            "total_tokens": prompt + completion,
+            "llm_calls": len(self.llm_calls),
+            "llm_latency": round(sum(c["latency"] for c in self.llm_calls), 4),
+            "models": sorted({c["model"] for c in self.llm_calls if c["model"]}),
+            "by_stage": by_stage,
+            "by_model": by_model,
+            "skipped": list(self.skipped),
+        }
+
+
+class BudgetExceeded(RuntimeError):
+    """Raised when a request runs out of its token budget before it has a query."""
+
+
+def llm_complete(
+    cfg: LLMConfig,
+    messages: List[Dict[str, str]],
+    trace: Optional[Trace] = None,
+    stage: str = "llm",
+    **kwargs: Any,
+) -> Any:
+    """Single chat completion call; recorded on `trace` when one is given."""
+    client = llm_client(cfg)
+    start = time.perf_counter()
+    resp = client.chat.completions.create(
+        model=cfg.model,
+        messages=messages,
+        max_tokens=cfg.max_tokens,
+        **kwargs,
+    )
+    if trace is not None:
+        trace.record_llm(stage, resp, time.perf_counter() - start)
+    return resp
+
+
 def chat_json(
     cfg: LLMConfig,
     messages: List[Dict[str, str]],
     response_format_json: bool = True,
     temperature: float = 0.2,
+    trace: Optional[Trace] = None,
+    stage: str = "generate",
 ) -> Dict[str, Any]:
     """Call the LLM and parse JSON content.
     Falls back to extracting a JSON block if the server ignores response_format.
     """
-    client = llm_client(cfg)
-
-    kwargs: Dict[str, Any] = dict(
-        model=cfg.model,
-        messages=messages,
-        max_tokens=cfg.max_tokens,
-        temperature=temperature,
-    )
+    kwargs: Dict[str, Any] = dict(temperature=temperature)
     if response_format_json:
         kwargs["response_format"] = {"type": "json_object"}
 
-    resp = client.chat.completions.create(**kwargs)
+    resp = llm_complete(cfg, messages, trace=trace, stage=stage, **kwargs)
     content = resp.choices[0].message.content or "{}"
 
     # Try direct JSON first
@@ -135,7 +223,9 @@ FORBIDDEN_SQL_PATTERNS = re.compile(
 )
 
 
+@lru_cache(maxsize=8)
 def build_engine(db_url: str) -> Engine:
+    # Cached per URL so requests share one connection pool
     # If SQLite file path without read-only flags, add them (safe default)
     if db_url.startswith("sqlite///") or db_url.startswith("sqlite:///"):
         # If already a URI with query, respect it
@@ -154,14 +244,144 @@ def detect_dialect(engine: Engine) -> str:
     return name  # e.g., 'sqlite'
 
 
+class _Stragglers:
+    """Raw DBAPI connections of in-flight sample queries, so they can be cancelled at the deadline."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._active: Dict[int, Any] = {}
+        self.cancelled = False
+
+    @contextmanager
+    def running(self, dbapi_conn: Any) -> Iterator[None]:
+        with self._lock:
+            self._active[id(dbapi_conn)] = dbapi_conn
+        try:
+            yield
+        finally:
+            # Unregistered before the connection goes back to the pool
+            with self._lock:
+                self._active.pop(id(dbapi_conn), None)
+
+    def cancel_all(self) -> int:
+        """Interrupt every running statement (psycopg cancel(), sqlite3 interrupt()); best-effort."""
+        with self._lock:
+            self.cancelled = True
+            for dbapi_conn in self._active.values():
+                for method in ("cancel", "interrupt"):
+                    fn = getattr(dbapi_conn, method, None)
+                    if callable(fn):
+                        try:
+                            fn()
+                        except Exception:
+                            pass
+                        break
+            return len(self._active)
+
+
+# Seconds, taken from the end of the introspection deadline, for cancelled sample
+# queries to hand their connections back (capped at a fifth of the deadline)
+INTROSPECTION_GRACE = 2.0
+
+
+def _introspection_capacity(engine: Engine) -> int:
+    """Pooled connections sample queries may hold at once: one below the pool size."""
+    pool_size = getattr(engine.pool, "size", None)
+    return max(1, pool_size() - 1) if callable(pool_size) else 4
+
+
+@lru_cache(maxsize=8)
+def _introspection_slots(engine: Engine) -> threading.BoundedSemaphore:
+    """Process-wide cap on pooled connections held by sample queries for one engine.
+
+    Shared by all concurrent snapshots, so introspection alone can never exhaust
+    the pool the pipeline's own queries draw from.
+    """
+    return threading.BoundedSemaphore(_introspection_capacity(engine))
+
+
+def _sample_table(
+    engine: Engine,
+    table: str,
+    sample_rows: int,
+    stragglers: Optional[_Stragglers] = None,
+    deadline_at: Optional[float] = None,
+    order_by: Optional[List[str]] = None,
+) -> Tuple[Optional[int], List[Dict[str, Any]]]:
+    """Row count and a small sample for one table, on its own pooled connection.
+
+    The sample is ordered by `order_by` (the primary key) when given, so the same
+    rows come back on every snapshot.
+    """
+    stragglers = stragglers or _Stragglers()
+    nrows = None
+    sample: List[Dict[str, Any]] = []
+
+    def limit_statement_time() -> None:
+        # Postgres enforces the deadline server-side too; SET LOCAL ends with the transaction
+        if deadline_at is None or not engine.dialect.name.startswith("postgres"):
+            return
+        ms = max(1, int(1000 * (deadline_at - time.monotonic())))
+        conn.exec_driver_sql(f"SET LOCAL statement_timeout = {ms}")
+
+    slots = _introspection_slots(engine)
+    if not slots.acquire(timeout=None if deadline_at is None else max(0.0, deadline_at - time.monotonic())):
+        return nrows, sample
+    try:
+        with engine.connect() as conn, stragglers.running(conn.connection.dbapi_connection):
+            # The snapshot may have given up while this worker waited for a connection
+            if stragglers.cancelled:
+                return nrows, sample
+
+            # SQLite extra safety (query only)
+            if engine.dialect.name == "sqlite":
+                try:
+                    conn.exec_driver_sql("PRAGMA query_only = ON")
+                except SQLAlchemyError:
+                    pass
+
+            # Row count (best-effort, ignore errors for huge/foreign tables)
+            try:
+                limit_statement_time()
+                nrows = conn.execute(text(f"SELECT COUNT(*) FROM \"{table}\"")).scalar_one()
+            except SQLAlchemyError:
+                conn.rollback()
+
+            # Small sample
+            if sample_rows > 0 and not stragglers.cancelled:
+                try:
+                    limit_statement_time()
+                    order = " ORDER BY " + ", ".join(f'"{c}"' for c in order_by) if order_by else ""
+                    q = text(f'SELECT * FROM "{table}"{order} LIMIT {int(sample_rows)}')
+                    res = conn.execute(q)
+                    # Convert rows to dicts
+                    sample = [dict(r._mapping) for r in res.fetchall()]
+                except SQLAlchemyError:
+                    pass
+    finally:
+        slots.release()
+    return nrows, sample
+
+
 def get_schema_snapshot(
     engine: Engine,
     tables_whitelist: Optional[List[str]] = None,
     max_tables: int = 30,
     sample_rows: int = 2,
     max_chars: int = 6000,
+    workers: int = 8,
+    deadline: float = 10.0,
 ) -> Tuple[Dict[str, Any], str]:
-    """Return (schema_dict, schema_prompt_str). Limits size to keep prompts small."""
+    """Return (schema_dict, schema_prompt_str). Limits size to keep prompts small.
+
+    Columns, primary keys and foreign keys are reflected for all tables at once;
+    per-table count/sample queries run concurrently on pooled connections, at
+    most one fewer than the engine's pool size across all snapshots in the
+    process. Tables whose queries have not finished in time are listed without
+    row count or sample; their statements are cancelled so the connections
+    return to the pool, and schema["complete"] is False. `deadline` bounds the
+    whole sampling phase, including the grace period for cancelled queries.
+    """
     insp = sa_inspect(engine)
     all_tables = insp.get_table_names()
     if tables_whitelist:
@@ -169,64 +389,82 @@ def get_schema_snapshot(
     else:
         tables = all_tables[:max_tables]
 
-    schema: Dict[str, Any] = {"tables": []}
-
-    with engine.connect() as conn:
-        # SQLite extra safety (query only)
-        if engine.dialect.name == "sqlite":
+    schema: Dict[str, Any] = {"tables": [], "complete": True}
+    tables_columns: Dict[Any, Any] = {}
+    tables_pks: Dict[Any, Any] = {}
+    tables_fks: Dict[Any, Any] = {}
+    stats: Dict[str, Tuple[Optional[int], List[Dict[str, Any]]]] = {}
+    if tables:
+        # Bulk reflection (one catalog round-trip per kind instead of per table)
+        tables_columns = insp.get_multi_columns(filter_names=tables)
+        tables_pks = insp.get_multi_pk_constraint(filter_names=tables)
+        tables_fks = insp.get_multi_foreign_keys(filter_names=tables)
+
+        # No more threads than the process-wide connection cap can serve
+        workers = min(workers, _introspection_capacity(engine))
+        grace = min(INTROSPECTION_GRACE, deadline / 5)
+        deadline_at = time.monotonic() + deadline - grace
+        stragglers = _Stragglers()
+        pool = ThreadPoolExecutor(max_workers=max(1, min(workers, len(tables))))
+        futures = {
+            pool.submit(
+                _sample_table,
+                engine,
+                t,
+                sample_rows,
+                stragglers,
+                deadline_at,
+                (tables_pks.get((None, t)) or {}).get("constrained_columns"),
+            ): t
+            for t in tables
+        }
+        done, pending = wait(futures, timeout=deadline - grace)
+        if pending:
+            schema["complete"] = False
+            # Stop queued tables and interrupt running ones; their results are not used
+            stragglers.cancel_all()
+            pool.shutdown(wait=False, cancel_futures=True)
+            wait(pending, timeout=grace)
+        else:
+            pool.shutdown(wait=False)
+        for fut in done:
             try:
-                conn.exec_driver_sql("PRAGMA query_only = ON")
+                stats[futures[fut]] = fut.result()
             except SQLAlchemyError:
                 pass
 
-        for t in tables:
-            cols = []
-            for c in insp.get_columns(t):
-                cols.append(
-                    {
-                        "name": c.get("name"),
-                        "type": str(c.get("type")),
-                        "nullable": bool(c.get("nullable", True)),
-                    }
-                )
-            pk = insp.get_pk_constraint(t).get("constrained_columns") or []
-            fks = [
+    for t in tables:
+        key = (None, t)
+        cols = []
+        for c in tables_columns.get(key, []):
+            cols.append(
                 {
-                    "constrained_columns": fk.get("constrained_columns"),
-                    "referred_table": fk.get("referred_table"),
-                    "referred_columns": fk.get("referred_columns"),
-                }
-                for fk in insp.get_foreign_keys(t)
-            ]
-
-            # Row count (best-effort, ignore errors for huge/foreign tables)
-            nrows = None
-            try:
-                nrows = conn.execute(text(f"SELECT COUNT(*) FROM \"{t}\"")).scalar_one()
-            except SQLAlchemyError:
-                pass
-
-            # Small sample
-            sample = []
-            if sample_rows > 0:
-                try:
-                    q = text(f'SELECT * FROM "{t}" LIMIT {int(sample_rows)}')
-                    res = conn.execute(q)
-                    # Convert rows to dicts
-                    sample = [dict(r._mapping) for r in res.fetchall()]
-                except SQLAlchemyError:
-                    pass
-
-            schema["tables"].append(
-                {
-                    "name": t,
-                    "columns": cols,
-                    "primary_key": pk,
-                    "foreign_keys": fks,
-                    "row_count": nrows,
-                    "sample": sample,
+                    "name": c.get("name"),
+                    "type": str(c.get("type")),
+                    "nullable": bool(c.get("nullable", True)),
                 }
             )
+        pk = (tables_pks.get(key) or {}).get("constrained_columns") or []
+        fks = [
+            {
+                "constrained_columns": fk.get("constrained_columns"),
+                "referred_table": fk.get("referred_table"),
+                "referred_columns": fk.get("referred_columns"),
+            }
+            for fk in tables_fks.get(key, [])
+        ]
+        nrows, sample = stats.get(t, (None, []))
+
+        schema["tables"].append(
+            {
+                "name": t,
+                "columns": cols,
+                "primary_key": pk,
+                "foreign_keys": fks,
+                "row_count": nrows,
+                "sample": sample,
+            }
+        )
 
     # Prompt-friendly rendering
     lines: List[str] = []
@@ -253,6 +491,78 @@ def get_schema_snapshot(
     return schema, prompt_str
 
 
+# Complete snapshots per (db_url, tables, sample_rows). Row counts and samples are
+# live data; caching them keeps the prompt prefix byte-identical across requests
+# until the entry expires.
+_SCHEMA_CACHE: "OrderedDict[Tuple[Any, ...], Tuple[float, str]]" = OrderedDict()
+_SCHEMA_CACHE_LOCK = threading.Lock()
+SCHEMA_CACHE_SIZE = 32
+# Snapshots being built per cache key: concurrent misses wait for one build
+_SCHEMA_BUILDS: Dict[Tuple[Any, ...], "_SchemaBuild"] = {}
+
+
+class _SchemaBuild:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Optional[Tuple[str, bool]] = None
+
+
+def cached_schema_prompt(
+    engine: Engine,
+    db_url: str,
+    tables_whitelist: Optional[List[str]] = None,
+    sample_rows: int = 2,
+    workers: int = 8,
+    deadline: float = 10.0,
+    ttl: float = 300.0,
+) -> Tuple[str, bool]:
+    """Return (schema_prompt_str, complete); snapshots cut short by the deadline are never cached.
+
+    Concurrent misses for the same key share one snapshot build (single flight).
+    """
+    key = (db_url, tuple(sorted(tables_whitelist)) if tables_whitelist else None, sample_rows)
+    with _SCHEMA_CACHE_LOCK:
+        hit = _SCHEMA_CACHE.get(key) if ttl > 0 else None
+        if hit is not None and time.monotonic() - hit[0] <= ttl:
+            _SCHEMA_CACHE.move_to_end(key)
+            return hit[1], True
+        build = _SCHEMA_BUILDS.get(key)
+        leader = build is None
+        if leader:
+            build = _SCHEMA_BUILDS[key] = _SchemaBuild()
+
+    if not leader:
+        # Builds are bounded by the deadline; the margin covers bulk reflection
+        build.done.wait(timeout=2 * deadline)
+        if build.result is not None:
+            return build.result
+        # The build failed; introspect on our own so its error surfaces here
+
+    try:
+        schema, prompt_str = get_schema_snapshot(
+            engine,
+            tables_whitelist=tables_whitelist,
+            sample_rows=sample_rows,
+            workers=workers,
+            deadline=deadline,
+        )
+        result = (prompt_str, bool(schema["complete"]))
+        if ttl > 0 and schema["complete"]:
+            with _SCHEMA_CACHE_LOCK:
+                _SCHEMA_CACHE[key] = (time.monotonic(), prompt_str)
+                _SCHEMA_CACHE.move_to_end(key)
+                while len(_SCHEMA_CACHE) > SCHEMA_CACHE_SIZE:
+                    _SCHEMA_CACHE.popitem(last=False)
+        if leader:
+            build.result = result
+        return result
+    finally:
+        if leader:
+            with _SCHEMA_CACHE_LOCK:
+                _SCHEMA_BUILDS.pop(key, None)
+            build.done.set()
+
+
 # ---------------------------
 # SQL validation and execution
 # ---------------------------
@@ -289,6 +599,143 @@ def exec_sql(engine: Engine, sql: str, max_rows: int = 5000) -> pd.DataFrame:
         return df
 
 
+def _column_kind(series: pd.Series) -> str:
+    """Classify a preview column to decide which aggregates are valid on it.
+
+    numeric: MIN/MAX/AVG; text and temporal: MIN/MAX, DISTINCT, top-k;
+    bool: DISTINCT, top-k (Postgres has no min(boolean)); other (json, arrays,
+    binary, all-null): null count only, since they are neither orderable nor
+    groupable on every backend.
+    """
+    if pd.api.types.is_bool_dtype(series):
+        return "bool"
+    if pd.api.types.is_numeric_dtype(series):
+        return "numeric"
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "temporal"
+    values = series.dropna().tolist()
+    if not values:
+        return "other"
+    if all(isinstance(v, bool) for v in values):
+        return "bool"
+    if all(isinstance(v, (int, float, Decimal)) for v in values):
+        return "numeric"
+    if all(isinstance(v, (dt.date, dt.time)) for v in values):
+        return "temporal"
+    if all(isinstance(v, str) for v in values):
+        return "text"
+    return "other"
+
+
+def profile_sql(
+    engine: Engine,
+    sql: str,
+    preview_rows: int = 25,
+    top_k: int = 5,
+) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """Profile the result of `sql` inside the database instead of pulling its rows.
+
+    Returns (preview_df, profile). Only `preview_rows` rows travel over the wire;
+    row count, per-column null counts, min/max/mean and top-k values for text and
+    boolean columns are computed with aggregate queries wrapping `sql`.
+
+    Cost: the wrapped query is evaluated 2 + k times (preview, one combined
+    aggregate, one top-k GROUP BY per text/boolean column), so expensive queries
+    with many such columns should lower `top_k` to 0.
+
+    Errors in the preview propagate (so the repair loop can act on them); the
+    aggregate queries are best-effort. If the combined aggregate fails it is
+    retried column by column so one bad column does not drop every statistic.
+    """
+    quote = engine.dialect.identifier_preparer.quote
+    wrapped = f"(\n{sql}\n) AS _ask_q"
+    preview = exec_sql(
+        engine, f"SELECT * FROM {wrapped} LIMIT {int(preview_rows)}", max_rows=preview_rows
+    )
+
+    kinds = {str(c): _column_kind(preview[c]) for c in preview.columns}
+    columns: Dict[str, Dict[str, Any]] = {name: {"kind": kind} for name, kind in kinds.items()}
+    profile: Dict[str, Any] = {"row_count": None, "columns": columns}
+
+    def column_exprs(i: int, name: str) -> List[str]:
+        qc = quote(name)
+        kind = kinds[name]
+        exprs = [f"COUNT({qc}) AS c{i}_nn"]
+        if kind in ("numeric", "text", "temporal"):
+            exprs += [f"MIN({qc}) AS c{i}_min", f"MAX({qc}) AS c{i}_max"]
+        if kind == "numeric":
+            exprs.append(f"AVG({qc}) AS c{i}_mean")
+        if kind in ("text", "temporal", "bool"):
+            exprs.append(f"COUNT(DISTINCT {qc}) AS c{i}_distinct")
+        return exprs
+
+    def apply(i: int, name: str, agg: Any) -> None:
+        stats = columns[name]
+        stats["nulls"] = agg["n"] - agg[f"c{i}_nn"]
+        for key in ("min", "max", "distinct"):
+            if f"c{i}_{key}" in agg:
+                stats[key] = agg[f"c{i}_{key}"]
+        if f"c{i}_mean" in agg:
+            mean = agg[f"c{i}_mean"]
+            stats["mean"] = float(mean) if mean is not None else None
+
+    names = list(kinds)
+    with engine.connect() as conn:
+        if engine.dialect.name == "sqlite":
+            try:
+                conn.exec_driver_sql("PRAGMA query_only = ON")
+            except SQLAlchemyError:
+                pass
+
+        # One pass for the count and every per-column aggregate
+        exprs = ["COUNT(*) AS n"]
+        for i, name in enumerate(names):
+            exprs += column_exprs(i, name)
+        try:
+            agg = conn.execute(text(f"SELECT {', '.join(exprs)} FROM {wrapped}")).mappings().one()
+            profile["row_count"] = agg["n"]
+            for i, name in enumerate(names):
+                apply(i, name, agg)
+        except SQLAlchemyError:
+            conn.rollback()
+            # Fall back to one aggregate per column; failing columns keep only their kind
+            for i, name in enumerate(names):
+                q = text(f"SELECT COUNT(*) AS n, {', '.join(column_exprs(i, name))} FROM {wrapped}")
+                try:
+                    agg = conn.execute(q).mappings().one()
+                except SQLAlchemyError:
+                    conn.rollback()
+                    continue
+                profile["row_count"] = agg["n"]
+                apply(i, name, agg)
+            if profile["row_count"] is None:
+                try:
+                    profile["row_count"] = conn.execute(
+                        text(f"SELECT COUNT(*) FROM {wrapped}")
+                    ).scalar_one()
+                except SQLAlchemyError:
+                    conn.rollback()
+
+        if top_k > 0:
+            for name in names:
+                if kinds[name] not in ("text", "bool"):
+                    continue
+                qc = quote(name)
+                q = text(
+                    f"SELECT {qc} AS value, COUNT(*) AS n FROM {wrapped} "
+                    f"GROUP BY {qc} ORDER BY n DESC LIMIT {int(top_k)}"
+                )
+                try:
+                    res = conn.execute(q)
+                    columns[name]["top"] = [
+                        {"value": r.value, "count": r.n} for r in res.fetchall()
+                    ]
+                except SQLAlchemyError:
+                    conn.rollback()
+
+    return preview, profile
+
+
 # ---------------------------
 # Prompts
 # ---------------------------
@@ -304,6 +751,7 @@ Rules:
 - Use table/column names exactly as provided.
 - Prefer LIMIT {default_limit} unless a smaller count is requested.
 - If unsure which columns hold a concept, pick best-effort from names/samples rather than inventing new ones.
+- Earlier turns of the conversation show previous requests and the JSON you returned for them; treat new requests as follow-ups and refine the previous SQL when they refer to it.
 """.strip()
 
 SUMMARIZER_SYS = """
@@ -315,9 +763,50 @@ ALWAYS ANSWER IN SPANISH, SIEMPRE RESPONDE EN ESPANOL.
 """.strip()
 
 
+def generator_messages(
+    dialect: str,
+    default_limit: int,
+    schema_prompt: str,
+    history: Optional[List["Turn"]],
+    user_content: str,
+) -> List[Dict[str, str]]:
+    """Build generator messages with a deterministic prefix for prefix/KV caching:
+    system prompt and schema first, then previous turns, then the new request.
+    """
+    system = GENERATOR_SYS.format(dialect=dialect, default_limit=default_limit)
+    messages = [{"role": "system", "content": f"{system}\n\nSchema:\n{schema_prompt}"}]
+    for turn in history or []:
+        messages.append({"role": "user", "content": f"User request: {turn.question}"})
+        messages.append({"role": "assistant", "content": turn.as_context()})
+    messages.append({"role": "user", "content": user_content})
+    return messages
+
+
 # ---------------------------
 # Dataclasses for service usage
 # ---------------------------
+@dataclass
+class Turn:
+    """Compact record of a previous question in a conversation."""
+
+    question: str
+    action: str
+    sql: str
+    row_count: Optional[int] = None
+    columns: Optional[List[str]] = None
+
+    def as_context(self) -> str:
+        # Fixed key order so a replayed turn renders to the same bytes every time
+        return json.dumps(
+            {
+                "action": self.action,
+                "sql": self.sql,
+                "result": {"rows": self.row_count, "columns": self.columns},
+            },
+            ensure_ascii=False,
+        )
+
+
 @dataclass
 class AskOptions:
     db_url: str
@@ -332,6 +821,23 @@ class AskOptions:
     sql_only: bool = False
     dry_run: bool = False
     verbose: bool = False
+    profile_only: bool = False
+    preview_rows: int = 25
+    # Optional admission gate: gate("llm") / gate("db") returns a context manager
+    # held around every LLM call / DB access (see admission.py)
+    gate: Optional[Callable[[str], ContextManager[Any]]] = None
+    # Conversation context: previous turns, and a schema snapshot to reuse verbatim
+    history: Optional[List[Turn]] = None
+    schema_prompt: Optional[str] = None
+    introspection_workers: int = 8
+    introspection_deadline: float = 10.0
+    # Seconds a complete schema snapshot is reused across requests; 0 disables
+    schema_ttl: float = 300.0
+    # Filled in by the pipeline when given; lets callers read it even if the request fails
+    trace: Optional[Trace] = None
+    # Max prompt+completion tokens for the request; once spent, repairs abort and
+    # summarization is skipped
+    token_budget: Optional[int] = None
 
 
 @dataclass
@@ -344,6 +850,18 @@ class AskResult:
     rows: Optional[List[Dict[str, Any]]]
     row_count: Optional[int]
     schema_prompt: str
+    profile: Optional[Dict[str, Any]] = None
+    columns: Optional[List[str]] = None
+    trace: Optional[Trace] = None
+    # False when introspection hit its deadline and some tables lack counts/samples
+    schema_complete: bool = True
+
+    @property
+    def usage(self) -> Optional[Dict[str, Any]]:
+        return self.trace.usage() if self.trace is not None else None
+
+
+BUDGET_SKIPPED_ANSWER = "[budget] token budget exhausted; summarization skipped."
 
 
 def ask_pipeline(question: str, options: AskOptions) -> AskResult:
@@ -354,18 +872,65 @@ def ask_pipeline(question: str, options: AskOptions) -> AskResult:
         max_tokens=1024,
     )
 
+    trace = options.trace if options.trace is not None else Trace()
+
+    def slot(resource: str) -> ContextManager[Any]:
+        return options.gate(resource) if options.gate else nullcontext()
+
+    def check_budget(stage: str) -> None:
+        if options.token_budget is not None and trace.total_tokens() >= options.token_budget:
+            raise BudgetExceeded(f"Token budget of {options.token_budget} exhausted before {stage}.")
+
+    def summarize(
+        sql_used: str, df: Optional[pd.DataFrame], profile: Optional[Dict[str, Any]] = None
+    ) -> str:
+        # Downgrade instead of failing: the query result is still returned
+        if options.token_budget is not None and trace.total_tokens() >= options.token_budget:
+            trace.skipped.append("summarize")
+            return BUDGET_SKIPPED_ANSWER
+        with slot("llm"), trace.stage("summarize"):
+            return summarize_answer(
+                cfg,
+                question,
+                schema_prompt,
+                sql_used=sql_used,
+                df=df,
+                profile=profile,
+                history=options.history,
+                trace=trace,
+            )
+
     engine = build_engine(options.db_url)
     dialect = detect_dialect(engine)
     if options.verbose:
         print(f"[info] dialect={dialect} url={options.db_url}")
 
-    _, schema_prompt = get_schema_snapshot(
-        engine,
-        tables_whitelist=options.tables,
-        sample_rows=options.sample_rows,
-    )
+    schema_complete = True
+    if options.schema_prompt:
+        schema_prompt = options.schema_prompt
+    else:
+        with slot("db"), trace.stage("schema"):
+            schema_prompt, schema_complete = cached_schema_prompt(
+                engine,
+                options.db_url,
+                tables_whitelist=options.tables,
+                sample_rows=options.sample_rows,
+                workers=options.introspection_workers,
+                deadline=options.introspection_deadline,
+                ttl=options.schema_ttl,
+            )
 
-    gen = generate_sql(cfg, question, dialect, schema_prompt, options.default_limit)
+    check_budget("generation")
+    with slot("llm"), trace.stage("generate"):
+        gen = generate_sql(
+            cfg,
+            question,
+            dialect,
+            schema_prompt,
+            options.default_limit,
+            history=options.history,
+            trace=trace,
+        )
     action = (gen.get("action") or "query").strip().lower()
     sql = (gen.get("sql") or "").strip()
     reason = gen.get("reason")
@@ -378,7 +943,7 @@ def ask_pipeline(question: str, options: AskOptions) -> AskResult:
     if action == "schema_summary" or not sql:
         answer = ""
         if not options.sql_only:
-            answer = summarize_answer(cfg, question, schema_prompt, sql_used="", df=None)
+            answer = summarize(sql_used="", df=None)
         return AskResult(
             question=question,
             action=action,
@@ -388,6 +953,8 @@ def ask_pipeline(question: str, options: AskOptions) -> AskResult:
             rows=None,
             row_count=None,
             schema_prompt=schema_prompt,
+            schema_complete=schema_complete,
+            trace=trace,
         )
 
     if not is_sql_safe(sql):
@@ -396,35 +963,28 @@ def ask_pipeline(question: str, options: AskOptions) -> AskResult:
         err_msg = "SQL failed safety checks (must be single SELECT without semicolons/DDL)."
         repaired = False
         for attempt in range(options.repair_attempts):
-            repair_prompt = {
-                "role": "user",
-                "content": textwrap.dedent(
-                    f"""
-                    The previous SQL was unsafe or invalid. Error: {err_msg}
-                    Please return corrected JSON with a single, safe SELECT for {dialect}.
-
-                    Original request: {question}
-
-                    Schema:
-                    {schema_prompt}
-                    """
-                ).strip(),
-            }
-            gen = chat_json(
-                cfg,
-                [
-                    {
-                        "role": "system",
-                        "content": GENERATOR_SYS.format(
-                            dialect=dialect, default_limit=options.default_limit
-                        ),
-                    },
-                    repair_prompt,
-                ],
-            )
+            repair_prompt = textwrap.dedent(
+                f"""
+                The previous SQL was unsafe or invalid. Error: {err_msg}
+                Please return corrected JSON with a single, safe SELECT for {dialect}.
+
+                Original request: {question}
+                """
+            ).strip()
+            check_budget("repair")
+            with slot("llm"), trace.stage("repair"):
+                gen = chat_json(
+                    cfg,
+                    generator_messages(
+                        dialect, options.default_limit, schema_prompt, options.history, repair_prompt
+                    ),
+                    trace=trace,
+                    stage="repair",
+                )
             action = (gen.get("action") or "query").strip().lower()
             sql = (gen.get("sql") or "").strip()
             reason = gen.get("reason")
+            trace.repairs.append({"kind": "safety", "error": err_msg, "sql": sql, "action": action})
             if options.verbose:
                 print(f"[repair {attempt+1}] action={action} reason={reason}")
                 if sql:
@@ -440,7 +1000,7 @@ def ask_pipeline(question: str, options: AskOptions) -> AskResult:
         if action == "schema_summary":
             answer = ""
             if not options.sql_only:
-                answer = summarize_answer(cfg, question, schema_prompt, sql_used="", df=None)
+                answer = summarize(sql_used="", df=None)
             return AskResult(
                 question=question,
                 action=action,
@@ -450,9 +1010,14 @@ def ask_pipeline(question: str, options: AskOptions) -> AskResult:
                 rows=None,
                 row_count=None,
                 schema_prompt=schema_prompt,
+                schema_complete=schema_complete,
+                trace=trace,
             )
 
-    sql = add_default_limit(sql, options.default_limit)
+    if not options.profile_only:
+        # When profiling, the default LIMIT would truncate the statistics; only the
+        # preview is limited (an explicit LIMIT written in the SQL is kept either way)
+        sql = add_default_limit(sql, options.default_limit)
 
     if options.sql_only:
         return AskResult(
@@ -464,6 +1029,8 @@ def ask_pipeline(question: str, options: AskOptions) -> AskResult:
             rows=None,
             row_count=None,
             schema_prompt=schema_prompt,
+            schema_complete=schema_complete,
+            trace=trace,
         )
 
     if options.dry_run:
@@ -476,12 +1043,26 @@ def ask_pipeline(question: str, options: AskOptions) -> AskResult:
             rows=None,
             row_count=None,
             schema_prompt=schema_prompt,
+            schema_complete=schema_complete,
+            trace=trace,
         )
 
     df: Optional[pd.DataFrame]
+    profile: Optional[Dict[str, Any]] = None
+
+    def run(candidate: str) -> Tuple[pd.DataFrame, Optional[Dict[str, Any]]]:
+        with slot("db"), trace.stage("execute"):
+            try:
+                # Raw rows are not needed: push statistics down to the DB, fetch a preview only
+                if options.profile_only:
+                    return profile_sql(engine, candidate, preview_rows=options.preview_rows)
+                return exec_sql(engine, candidate, max_rows=options.max_rows), None
+            except PoolTimeout as e:
+                # No connection was checked out, so there is no SQL error for the LLM to repair
+                raise RuntimeError(f"Database busy: {e}") from e
 
     try:
-        df = exec_sql(engine, sql, max_rows=options.max_rows)
+        df, profile = run(sql)
     except SQLAlchemyError as e:
         if options.verbose:
             print(f"[exec error] {e}; attempting LLM repair with error context…")
@@ -489,38 +1070,33 @@ def ask_pipeline(question: str, options: AskOptions) -> AskResult:
         err_msg = str(e)
         repaired = False
         for attempt in range(options.repair_attempts):
-            repair_prompt = {
-                "role": "user",
-                "content": textwrap.dedent(
-                    f"""
-                    The SQL failed to run. DB error: {err_msg}
-                    Please fix and return JSON with one safe SELECT for {dialect}.
-
-                    Original request: {question}
-
-                    Schema:
-                    {schema_prompt}
-
-                    Previous SQL:
-                    {sql}
-                    """
-                ).strip(),
-            }
-            gen = chat_json(
-                cfg,
-                [
-                    {
-                        "role": "system",
-                        "content": GENERATOR_SYS.format(
-                            dialect=dialect, default_limit=options.default_limit
-                        ),
-                    },
-                    repair_prompt,
-                ],
-            )
+            repair_prompt = textwrap.dedent(
+                f"""
+                The SQL failed to run. DB error: {err_msg}
+                Please fix and return JSON with one safe SELECT for {dialect}.
+
+                Original request: {question}
+
+                Previous SQL:
+                {sql}
+                """
+            ).strip()
+            check_budget("repair")
+            with slot("llm"), trace.stage("repair"):
+                gen = chat_json(
+                    cfg,
+                    generator_messages(
+                        dialect, options.default_limit, schema_prompt, options.history, repair_prompt
+                    ),
+                    trace=trace,
+                    stage="repair",
+                )
             action = (gen.get("action") or "query").strip().lower()
             candidate_sql = (gen.get("sql") or "").strip()
             reason = gen.get("reason")
+            trace.repairs.append(
+                {"kind": "exec", "error": err_msg, "sql": candidate_sql, "action": action}
+            )
             if options.verbose:
                 print(f"[repair {attempt+1}] action={action} reason={reason}")
                 if candidate_sql:
@@ -532,9 +1108,10 @@ def ask_pipeline(question: str, options: AskOptions) -> AskResult:
                 break
             if not (candidate_sql and is_sql_safe(candidate_sql)):
                 continue
-            candidate_sql = add_default_limit(candidate_sql, options.default_limit)
+            if not options.profile_only:
+                candidate_sql = add_default_limit(candidate_sql, options.default_limit)
             try:
-                df = exec_sql(engine, candidate_sql, max_rows=options.max_rows)
+                df, profile = run(candidate_sql)
                 sql = candidate_sql
                 repaired = True
                 break
@@ -544,9 +1121,12 @@ def ask_pipeline(question: str, options: AskOptions) -> AskResult:
         if not repaired:
             raise RuntimeError("Query failed after repair attempts.")
 
-    answer = summarize_answer(cfg, question, schema_prompt, sql_used=sql, df=df)
+    answer = summarize(sql_used=sql, df=df, profile=profile)
     rows = df.to_dict(orient="records") if df is not None else None
     row_count = len(df) if df is not None else None
+    columns = [str(c) for c in df.columns] if df is not None else None
+    if profile is not None and profile.get("row_count") is not None:
+        row_count = profile["row_count"]
 
     return AskResult(
         question=question,
@@ -557,6 +1137,10 @@ def ask_pipeline(question: str, options: AskOptions) -> AskResult:
         rows=rows,
         row_count=row_count,
         schema_prompt=schema_prompt,
+        schema_complete=schema_complete,
+        profile=profile,
+        columns=columns,
+        trace=trace,
     )
 
 
@@ -570,20 +1154,13 @@ def generate_sql(
     dialect: str,
     schema_prompt: str,
     default_limit: int,
+    history: Optional[List[Turn]] = None,
+    trace: Optional[Trace] = None,
 ) -> Dict[str, Any]:
-    sys_msg = {"role": "system", "content": GENERATOR_SYS.format(dialect=dialect, default_limit=default_limit)}
-    usr_msg = {
-        "role": "user",
-        "content": textwrap.dedent(
-            f"""
-            User request: {question}
-
-            Schema:
-            {schema_prompt}
-            """
-        ).strip(),
-    }
-    return chat_json(cfg, [sys_msg, usr_msg], response_format_json=True, temperature=0.1)
+    messages = generator_messages(
+        dialect, default_limit, schema_prompt, history, f"User request: {question}"
+    )
+    return chat_json(cfg, messages, response_format_json=True, temperature=0.1, trace=trace)
 
 
 def summarize_answer(
@@ -593,14 +1170,24 @@ def summarize_answer(
     sql_used: str,
     df: Optional[pd.DataFrame],
     max_table_rows: int = 25,
+    profile: Optional[Dict[str, Any]] = None,
+    history: Optional[List[Turn]] = None,
+    trace: Optional[Trace] = None,
 ) -> str:
     # Prepare a compact representation of the result for the LLM
     payload: Dict[str, Any] = {
         "question": question,
         "sql": sql_used,
-        "schema_overview": schema_prompt,
     }
-    if df is not None:
+    if history:
+        payload["previous_questions"] = [t.question for t in history]
+    if profile is not None:
+        # Statistics were computed in the DB over the full result; df is only a preview
+        payload["result_rows"] = profile.get("row_count")
+        payload["result_profile"] = profile.get("columns")
+        if df is not None:
+            payload["result_preview_table"] = df.head(max_table_rows).to_dict(orient="records")
+    elif df is not None:
         # Truncate for prompt safety
         sample = df.head(max_table_rows)
         payload["result_preview_rows"] = len(df)
@@ -610,15 +1197,10 @@ def summarize_answer(
         if numeric_cols:
             payload["numeric_summary"] = sample[numeric_cols].describe().to_dict()
 
-    sys_msg = {"role": "system", "content": SUMMARIZER_SYS}
-    usr_msg = {"role": "user", "content": json.dumps(payload, ensure_ascii=False)}
-    client = llm_client(cfg)
-    resp = client.chat.completions.create(
-        model=cfg.model,
-        messages=[sys_msg, usr_msg],
-        max_tokens=cfg.max_tokens,
-        temperature=0.3,
-    )
+    # Schema goes in the system message so the prefix is stable across requests
+    sys_msg = {"role": "system", "content": f"{SUMMARIZER_SYS}\n\nSchema overview:\n{schema_prompt}"}
+    usr_msg = {"role": "user", "content": json.dumps(payload, ensure_ascii=False, default=str)}
+    resp = llm_complete(cfg, [sys_msg, usr_msg], trace=trace, stage="summarize", temperature=0.3)
     return resp.choices[0].message.content.strip()
 
 
@@ -626,6 +1208,17 @@ def summarize_answer(
 # CLI
 # ---------------------------
 
+def positive_int(value: str) -> int:
+    """argparse type for counts that must be at least 1."""
+    try:
+        n = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {value!r}")
+    if n < 1:
+        raise argparse.ArgumentTypeError(f"must be >= 1, got {n}")
+    return n
+
+
 def main(argv: Optional[List[str]] = None) -> int:
     p = argparse.ArgumentParser(description="Ask questions of a SQL database with an LLM → SQL pipeline.")
     p.add_argument("question", help="Natural language question to ask")
@@ -641,6 +1234,9 @@ def main(argv: Optional[List[str]] = None) -> int:
     p.add_argument("--sql-only", action="store_true", help="Print only the SQL the LLM produced and exit")
     p.add_argument("--dry-run", action="store_true", help="Generate SQL but do not execute it")
     p.add_argument("--verbose", action="store_true", help="Verbose logs")
+    p.add_argument("--profile-only", action="store_true", help="Profile the result in the DB and fetch only a preview instead of all rows")
+    p.add_argument("--preview-rows", type=positive_int, default=25, help="Rows to fetch as preview when --profile-only is set")
+    p.add_argument("--token-budget", type=positive_int, help="Max LLM tokens for the request; summarization is skipped once spent")
 
     args = p.parse_args(argv)
 
@@ -657,6 +1253,9 @@ def main(argv: Optional[List[str]] = None) -> int:
         sql_only=args.sql_only,
         dry_run=args.dry_run,
         verbose=args.verbose,
+        profile_only=args.profile_only,
+        preview_rows=args.preview_rows,
+        token_budget=args.token_budget,
     )
 
     try:
@@ -668,6 +1267,14 @@ def main(argv: Optional[List[str]] = None) -> int:
         print(f"[fatal] Unexpected error: {exc}", file=sys.stderr)
         return 3
 
+    if args.verbose and result.usage:
+        usage = result.usage
+        print(
+            f"[usage] prompt={usage['prompt_tokens']} completion={usage['completion_tokens']} "
+            f"calls={usage['llm_calls']} llm_latency={usage['llm_latency']}s",
+            file=sys.stderr,
+        )
+
     if args.sql_only:
         print(result.sql)
         return 0
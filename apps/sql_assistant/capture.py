@@ -0,0 +1,70 @@
+"""
+capture.py — Opt-in traffic capture for the ask service
+
+Each `/ask` request is appended as one compact JSON line (question, request
+options, generated SQL, repair history, stage timings and every LLM completion
+with its token usage) to a size-rotated log. `replay.py` reads these logs back
+to drive load tests against a stubbed LLM. Writes and rotation happen on a
+background listener thread, so `record` never blocks on disk.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class CaptureLog:
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024, backups: int = 5) -> None:
+        self.path = path
+        # Dedicated logger: RotatingFileHandler gives thread-safe appends and rotation
+        self._logger = logging.getLogger(f"sql_assistant.capture.{path}")
+        self._logger.setLevel(logging.INFO)
+        self._logger.propagate = False
+        self._listener: Optional[QueueListener] = None
+        if not self._logger.handlers:
+            handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            entries: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+            self._listener = QueueListener(entries, handler)
+            self._listener.start()
+            self._logger.addHandler(QueueHandler(entries))
+
+    @classmethod
+    def from_env(cls) -> Optional["CaptureLog"]:
+        """Enabled only when ASK_CAPTURE_PATH is set."""
+        path = os.environ.get("ASK_CAPTURE_PATH")
+        if not path:
+            return None
+        try:
+            max_mb = int(os.environ.get("ASK_CAPTURE_MAX_MB", 50))
+            backups = int(os.environ.get("ASK_CAPTURE_BACKUPS", 5))
+        except ValueError:
+            max_mb, backups = 50, 5
+        return cls(path, max_bytes=max_mb * 1024 * 1024, backups=backups)
+
+    def record(self, entry: Dict[str, Any]) -> None:
+        self._logger.info(json.dumps(entry, ensure_ascii=False, separators=(",", ":"), default=str))
+
+    def close(self) -> None:
+        """Flush pending entries to disk and stop the writer thread."""
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+
+def read_capture(paths: List[str]) -> Iterator[Dict[str, Any]]:
+    """Yield captured entries from one or more log files (rotated files included as given)."""
+    for path in paths:
+        with open(path, encoding="utf-8") as fh:
+            for line in fh:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+replay.py — Replay captured ask-service traffic as a load test
+
+Subcommands
+- stub-llm: OpenAI-compatible server that answers with the completions recorded
+  in a capture log (see capture.py), optionally with the recorded latency.
+- run: send the captured requests to a target instance at the recorded rate
+  (scaled with --speed) or a fixed --rate, and write latency results as JSON.
+- compare: compare two run results and flag latency regressions and new failures.
+
+Usage
+  # on the service under test, point LLM_BASE_URL at the stub
+  python -m sql_assistant.replay stub-llm capture.jsonl --port 9100
+  python -m sql_assistant.replay run capture.jsonl --target http://localhost:9000 --speed 2 --out new.json
+  python -m sql_assistant.replay compare old.json new.json --threshold 0.10
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from fastapi import FastAPI, Request
+
+from .capture import read_capture
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+# ---------------------------
+# Stub LLM
+# ---------------------------
+class CompletionBook:
+    """Recorded completions keyed by (question, stage), served round-robin."""
+
+    def __init__(self, entries: List[Dict[str, Any]]) -> None:
+        calls: Dict[Tuple[str, str], List[Dict[str, Any]]] = defaultdict(list)
+        for entry in entries:
+            for call in entry.get("llm") or []:
+                calls[(entry["question"], call.get("stage") or "generate")].append(call)
+        self._cycles = {key: itertools.cycle(recorded) for key, recorded in calls.items()}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def classify(messages: List[Dict[str, Any]], json_mode: bool) -> Tuple[Optional[str], str]:
+        """Recover (question, stage) from the prompts built by ask.py."""
+        content = str(messages[-1].get("content") or "") if messages else ""
+        if not json_mode:
+            try:
+                return json.loads(content).get("question"), "summarize"
+            except (json.JSONDecodeError, AttributeError):
+                return None, "summarize"
+        if content.startswith("User request: "):
+            return content[len("User request: ") :], "generate"
+        for line in content.splitlines():
+            if line.strip().startswith("Original request: "):
+                return line.strip()[len("Original request: ") :], "repair"
+        return None, "generate"
+
+    def next(self, question: Optional[str], stage: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            cycle = self._cycles.get((question or "", stage))
+            return next(cycle) if cycle is not None else None
+
+
+def stub_app(book: CompletionBook, latency_scale: float = 1.0) -> FastAPI:
+    app = FastAPI(title="LUCAI ask replay stub LLM")
+    counter = itertools.count()
+
+    @app.post("/v1/chat/completions")
+    async def completions(request: Request) -> Dict[str, Any]:
+        body = await request.json()
+        question, stage = book.classify(body.get("messages") or [], "response_format" in body)
+        call = book.next(question, stage)
+        if call is None:
+            # Unknown traffic: answer without SQL so the pipeline still completes
+            content = (
+                json.dumps({"action": "schema_summary", "sql": "", "reason": "replay stub"})
+                if stage != "summarize"
+                else "replay stub"
+            )
+            call = {"content": content, "prompt_tokens": 0, "completion_tokens": 0, "latency": 0.0}
+        if latency_scale > 0 and call.get("latency"):
+            await asyncio.sleep(call["latency"] * latency_scale)
+        prompt_tokens = call.get("prompt_tokens") or 0
+        completion_tokens = call.get("completion_tokens") or 0
+        return {
+            "id": f"replay-{next(counter)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": call.get("model") or body.get("model") or "replay",
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": call.get("content") or ""},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    return app
+
+
+# ---------------------------
+# Load runner
+# ---------------------------
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile; None for an empty list."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def error_rate(statuses: Dict[str, int]) -> Optional[float]:
+    """Share of non-200 responses; None when there were no requests."""
+    total = sum(statuses.values())
+    return round(1 - statuses.get("200", 0) / total, 4) if total else None
+
+
+def summarize_latencies(results: List[Dict[str, Any]], wall: float) -> Dict[str, Any]:
+    results = [r for r in results if r]  # requests that never got a result slot filled
+    latencies = [r["latency"] for r in results]
+    ok = [r["latency"] for r in results if r["status"] == 200]
+    statuses: Dict[str, int] = defaultdict(int)
+    for r in results:
+        statuses[str(r["status"])] += 1
+    summary: Dict[str, Any] = {
+        "requests": len(results),
+        "statuses": dict(statuses),
+        "error_rate": error_rate(dict(statuses)),
+        "throughput_rps": round(len(results) / wall, 3) if wall > 0 else None,
+        "mean": round(sum(latencies) / len(latencies), 4) if latencies else None,
+        "max": round(max(latencies), 4) if latencies else None,
+        "ok_mean": round(sum(ok) / len(ok), 4) if ok else None,
+        "ok_max": round(max(ok), 4) if ok else None,
+    }
+    for pct in PERCENTILES:
+        summary[f"p{pct}"] = percentile(latencies, pct)
+        summary[f"ok_p{pct}"] = percentile(ok, pct)
+    return summary
+
+
+def replay(
+    entries: List[Dict[str, Any]],
+    target: str,
+    speed: float = 1.0,
+    rate: Optional[float] = None,
+    concurrency: int = 32,
+    timeout: float = 120.0,
+) -> Dict[str, Any]:
+    """Open-loop replay: requests are sent on schedule regardless of earlier responses."""
+    entries = sorted(entries, key=lambda e: e.get("ts") or 0.0)
+    t0 = (entries[0].get("ts") or 0.0) if entries else 0.0
+    if rate:
+        offsets = [i / rate for i in range(len(entries))]
+    else:
+        offsets = [((e.get("ts") or t0) - t0) / max(speed, 1e-9) for e in entries]
+
+    client = httpx.Client(base_url=target, timeout=timeout, trust_env=False)
+    session_map: Dict[str, str] = {}
+    session_lock = threading.Lock()
+    results: List[Dict[str, Any]] = [{} for _ in entries]
+
+    def target_session(captured: str) -> Optional[str]:
+        # Captured session ids do not exist on the target; open one per captured id
+        with session_lock:
+            if captured not in session_map:
+                resp = client.post("/sessions", json={})
+                if resp.status_code != 200:
+                    return None
+                session_map[captured] = resp.json()["session_id"]
+            return session_map[captured]
+
+    def send(i: int, entry: Dict[str, Any], scheduled: float) -> None:
+        body = {"question": entry["question"], **(entry.get("options") or {})}
+        headers = {"X-Client-Id": str(entry.get("client") or "replay")}
+        try:
+            if body.get("session_id"):
+                body["session_id"] = target_session(body["session_id"])
+            status = client.post("/ask", json=body, headers=headers).status_code
+        except Exception as exc:
+            # Transport errors and malformed /sessions replies alike: record, never drop
+            status = f"error:{type(exc).__name__}"
+        # Latency from the scheduled send time so client-side queueing is not hidden
+        results[i] = {
+            "i": i,
+            "question": entry["question"],
+            "status": status,
+            "recorded_status": entry.get("status"),
+            "latency": round(time.monotonic() - scheduled, 4),
+        }
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i, (entry, offset) in enumerate(zip(entries, offsets)):
+            scheduled = start + offset
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, i, entry, scheduled)
+    wall = time.monotonic() - start
+    client.close()
+
+    return {
+        "target": target,
+        "speed": speed,
+        "rate": rate,
+        "started": time.time() - wall,
+        "summary": summarize_latencies(results, wall),
+        "requests": results,
+    }
+
+
+def compare(baseline: Dict[str, Any], candidate: Dict[str, Any], threshold: float = 0.10) -> Dict[str, Any]:
+    """Latency deltas over successful requests, per-request slowdowns above `threshold`
+    (relative) and status changes.
+
+    Failures count as regressions on their own: a higher error rate, or any request
+    that answered 200 in the baseline and not in the candidate. Otherwise a build
+    that fails fast would look faster.
+    """
+    deltas: Dict[str, Any] = {}
+    regressions: List[str] = []
+    for key in ["ok_mean", *(f"ok_p{p}" for p in PERCENTILES), "ok_max"]:
+        old, new = baseline["summary"].get(key), candidate["summary"].get(key)
+        if old is None or new is None:
+            continue
+        rel = (new - old) / old if old else 0.0
+        deltas[key] = {"baseline": old, "candidate": new, "change": round(rel, 4)}
+        if rel > threshold:
+            regressions.append(key)
+
+    old_by_i = {r["i"]: r for r in baseline.get("requests", []) if r}
+    slower = []
+    for r in candidate.get("requests", []):
+        old = old_by_i.get(r.get("i"))
+        if not old or not old["latency"] or old["status"] != 200 or r["status"] != 200:
+            continue
+        rel = (r["latency"] - old["latency"]) / old["latency"]
+        if rel > threshold:
+            slower.append(
+                {
+                    "i": r["i"],
+                    "question": r.get("question"),
+                    "baseline": old["latency"],
+                    "candidate": r["latency"],
+                    "change": round(rel, 4),
+                }
+            )
+    slower.sort(key=lambda x: x["change"], reverse=True)
+
+    status_changes = [
+        {"i": r["i"], "baseline": old_by_i[r["i"]]["status"], "candidate": r["status"]}
+        for r in candidate.get("requests", [])
+        if r and r.get("i") in old_by_i and old_by_i[r["i"]]["status"] != r["status"]
+    ]
+    old_errors = error_rate(baseline["summary"].get("statuses") or {})
+    new_errors = error_rate(candidate["summary"].get("statuses") or {})
+    if new_errors is not None and new_errors > (old_errors or 0.0):
+        regressions.append("error_rate")
+    if any(c["baseline"] == 200 for c in status_changes):
+        regressions.append("status")
+    return {
+        "error_rate": {"baseline": old_errors, "candidate": new_errors},
+        "deltas": deltas,
+        "regressions": regressions,
+        "slower_requests": slower[:20],
+        "status_changes": status_changes,
+    }
+
+
+# ---------------------------
+# CLI
+# ---------------------------
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Replay captured ask-service traffic.")
+    sub = p.add_subparsers(dest="command", required=True)
+
+    ps = sub.add_parser("stub-llm", help="Serve recorded completions as an OpenAI-compatible LLM")
+    ps.add_argument("capture", nargs="+", help="Capture log file(s)")
+    ps.add_argument("--host", default="127.0.0.1")
+    ps.add_argument("--port", type=int, default=9100)
+    ps.add_argument("--latency-scale", type=float, default=1.0, help="Multiply recorded LLM latency (0 = no delay)")
+
+    pr = sub.add_parser("run", help="Send captured requests to a target instance")
+    pr.add_argument("capture", nargs="+", help="Capture log file(s)")
+    pr.add_argument("--target", required=True, help="Base URL of the ask service")
+    pr.add_argument("--speed", type=float, default=1.0, help="Replay speed relative to the recording (2 = twice as fast)")
+    pr.add_argument("--rate", type=float, help="Fixed request rate (req/s) instead of the recorded timing")
+    pr.add_argument("--concurrency", type=int, default=32, help="Max in-flight requests")
+    pr.add_argument("--limit", type=int, help="Replay only the first N requests")
+    pr.add_argument("--out", help="Write full results as JSON to this path")
+
+    pc = sub.add_parser("compare", help="Compare two run results")
+    pc.add_argument("baseline")
+    pc.add_argument("candidate")
+    pc.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown counted as regression")
+
+    args = p.parse_args(argv)
+
+    if args.command == "stub-llm":
+        import uvicorn
+
+        book = CompletionBook(list(read_capture(args.capture)))
+        uvicorn.run(stub_app(book, latency_scale=args.latency_scale), host=args.host, port=args.port)
+        return 0
+
+    if args.command == "run":
+        entries = list(read_capture(args.capture))
+        if args.limit:
+            entries = entries[: args.limit]
+        if not entries:
+            print("[fatal] No captured requests found", file=sys.stderr)
+            return 2
+        report = replay(
+            entries,
+            args.target,
+            speed=args.speed,
+            rate=args.rate,
+            concurrency=args.concurrency,
+        )
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as fh:
+                json.dump(report, fh, ensure_ascii=False, indent=2)
+        print(json.dumps(report["summary"], indent=2))
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as fh:
+        baseline = json.load(fh)
+    with open(args.candidate, encoding="utf-8") as fh:
+        candidate = json.load(fh)
+    result = compare(baseline, candidate, threshold=args.threshold)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 1 if result["regressions"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,13 +1,21 @@
 from __future__ import annotations
 
 import os
-from typing import Dict, List, Optional
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional
 from urllib.parse import unquote
 
-from fastapi import FastAPI, HTTPException
+import anyio.to_thread
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 
-from .ask import AskOptions, AskResult, ask_pipeline
+from .admission import AdmissionRejected, controller_from_env
+from .ask import AskOptions, AskResult, Trace, Turn, ask_pipeline
+from .capture import CaptureLog
+from .sessions import SessionStore
+from .usage import TokenMeter
 
 
 def env_int(name: str, default: int) -> int:
@@ -34,6 +42,19 @@ class AskRequest(BaseModel):
     sample_rows: Optional[int] = None
     repair_attempts: Optional[int] = None
     verbose: bool = False
+    profile_only: bool = Field(
+        default=False, description="Perfilar el resultado en la base y devolver solo una vista previa"
+    )
+    preview_rows: Optional[int] = Field(
+        default=None, ge=1, description="Filas de vista previa cuando profile_only está activo"
+    )
+    priority: Literal["interactive", "batch"] = Field(
+        default="interactive", description="Clase de prioridad: chat interactivo o reportes batch"
+    )
+    session_id: Optional[str] = Field(default=None, description="Sesión conversacional (ver /sessions)")
+    token_budget: Optional[int] = Field(
+        default=None, ge=1, description="Máximo de tokens LLM para el pedido; al agotarse se omite el resumen"
+    )
 
 
 class AskResponse(BaseModel):
@@ -44,9 +65,49 @@ class AskResponse(BaseModel):
     row_count: Optional[int]
     rows: Optional[List[Dict[str, object]]]
     schema_prompt: str
+    profile: Optional[Dict[str, object]] = None
+    session_id: Optional[str] = None
+    usage: Optional[Dict[str, object]] = None
+
+
+class SessionCreateRequest(BaseModel):
+    tables: Optional[List[str]] = Field(default=None, description="Lista de tablas permitidas")
+
+
+class SessionResponse(BaseModel):
+    session_id: str
+    tables: Optional[List[str]]
+    turns: List[Dict[str, object]]
 
 
-app = FastAPI(title="LUCAI SQL Assistant API", version="0.1.0")
+admission = controller_from_env(env_int)
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    # Admitted requests must never wait for a threadpool thread
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = max(limiter.total_tokens, admission.thread_tokens())
+    yield
+    if capture is not None:
+        capture.close()
+
+
+app = FastAPI(title="LUCAI SQL Assistant API", version="0.1.0", lifespan=lifespan)
+capture = CaptureLog.from_env()
+meter = TokenMeter(
+    client_budget=env_int("ASK_CLIENT_TOKEN_BUDGET", 0),
+    window=float(env_int("ASK_CLIENT_BUDGET_WINDOW", 3600)),
+)
+sessions = SessionStore(
+    max_sessions=env_int("ASK_SESSION_MAX", 1000),
+    ttl=float(env_int("ASK_SESSION_TTL", 3600)),
+    max_turns=env_int("ASK_SESSION_TURNS", 6),
+)
+
+
+def client_id(request: Request) -> str:
+    return request.headers.get("x-client-id") or (request.client.host if request.client else "unknown")
 
 
 @app.get("/healthz")
@@ -54,8 +115,88 @@ def healthz() -> Dict[str, str]:
     return {"status": "ok"}
 
 
+@app.get("/admission")
+def admission_stats() -> Dict[str, Any]:
+    return admission.stats()
+
+
+@app.get("/usage")
+def usage_stats() -> Dict[str, Any]:
+    return meter.stats()
+
+
+@app.post("/sessions", response_model=SessionResponse)
+def create_session(payload: Optional[SessionCreateRequest] = None) -> SessionResponse:
+    session = sessions.create(tables=payload.tables if payload else None)
+    return SessionResponse(session_id=session.id, tables=session.tables, turns=[])
+
+
+@app.get("/sessions/{session_id}", response_model=SessionResponse)
+def get_session(session_id: str) -> SessionResponse:
+    session = sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Unknown session {session_id}")
+    return SessionResponse(
+        session_id=session.id,
+        tables=session.tables,
+        turns=[vars(t) for t in session.turns],
+    )
+
+
+@app.delete("/sessions/{session_id}")
+def delete_session(session_id: str) -> Dict[str, str]:
+    if not sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail=f"Unknown session {session_id}")
+    return {"status": "deleted"}
+
+
+def capture_request(
+    client: str,
+    payload: AskRequest,
+    options: AskOptions,
+    status: int,
+    started: float,
+    result: Optional[AskResult],
+) -> None:
+    if capture is None:
+        return
+    capture.record(
+        {
+            "ts": round(started, 3),
+            "client": client,
+            "question": payload.question,
+            "options": payload.model_dump(exclude={"question"}, exclude_defaults=True),
+            "status": status,
+            "latency": round(time.time() - started, 4),
+            "action": result.action if result else None,
+            "sql": result.sql if result else None,
+            "row_count": result.row_count if result else None,
+            "timings": {k: round(v, 4) for k, v in options.trace.timings.items()},
+            "repairs": options.trace.repairs,
+            "llm": options.trace.llm_calls,
+        }
+    )
+
+
+def run_admitted(client: str, payload: AskRequest, options: AskOptions, started: float) -> AskResult:
+    """Pipeline plus usage/capture bookkeeping for an admitted request; runs in the threadpool."""
+    result: Optional[AskResult] = None
+    status = 500
+    try:
+        result = ask_pipeline(payload.question, options)
+        status = 200
+        return result
+    except RuntimeError:
+        status = 400
+        raise
+    finally:
+        # Tokens are spent even when the request fails
+        meter.record(client, options.trace.usage())
+        capture_request(client, payload, options, status, started, result)
+
+
 @app.post("/ask", response_model=AskResponse)
-def ask_endpoint(payload: AskRequest) -> AskResponse:
+async def ask_endpoint(payload: AskRequest, request: Request, response: Response) -> AskResponse:
     options = AskOptions(
         db_url=os.environ.get("DB_URL", "sqlite:///file:./mezclas_dummy.db?mode=ro&uri=true"),
         model=os.environ.get("LLM_MODEL", "local"),
@@ -69,8 +210,27 @@ def ask_endpoint(payload: AskRequest) -> AskResponse:
         sql_only=payload.sql_only,
         dry_run=payload.dry_run,
         verbose=payload.verbose or env_bool("ASK_VERBOSE", False),
+        profile_only=payload.profile_only,
+        preview_rows=payload.preview_rows or max(1, env_int("ASK_PREVIEW_ROWS", 25)),
+        introspection_workers=env_int("ASK_INTROSPECTION_WORKERS", 8),
+        introspection_deadline=float(env_int("ASK_INTROSPECTION_DEADLINE", 10)),
+        schema_ttl=float(env_int("ASK_SCHEMA_TTL", 300)),
     )
 
+    session = None
+    if payload.session_id:
+        session = sessions.get(payload.session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail=f"Unknown session {payload.session_id}")
+        if payload.tables is None or payload.tables == session.tables:
+            # Same table set: reuse the snapshot verbatim so the prompt prefix stays identical
+            options.tables = session.tables
+            options.schema_prompt = session.schema_prompt
+        else:
+            session.tables = payload.tables
+            session.schema_prompt = None
+        options.history = list(session.turns)
+
     db_url = options.db_url
     if db_url.startswith("sqlite:///file:"):
         raw_path = db_url[len("sqlite:///file:") :].split("?", 1)[0]
@@ -78,13 +238,55 @@ def ask_endpoint(payload: AskRequest) -> AskResponse:
         if not os.path.exists(db_path):
             raise HTTPException(status_code=503, detail=f"Database not found at {db_path}")
 
+    client = client_id(request)
+    budgets = [b for b in (payload.token_budget, env_int("ASK_REQUEST_TOKEN_BUDGET", 0)) if b and b > 0]
+    remaining = meter.remaining(client)
+    if remaining is not None:
+        if remaining <= 0:
+            raise HTTPException(
+                status_code=429,
+                detail=f"Token budget exhausted for client {client}",
+                headers={"Retry-After": str(meter.retry_after(client))},
+            )
+        budgets.append(remaining)
+    options.token_budget = min(budgets) if budgets else None
+    options.trace = Trace()
+    started = time.time()
     try:
-        result: AskResult = ask_pipeline(payload.question, options)
+        # Admission waits in the event loop; only admitted requests take a thread
+        async with admission.admit(client, payload.priority) as ticket:
+            options.gate = ticket.gate
+            result = await run_in_threadpool(run_admitted, client, payload, options, started)
+    except AdmissionRejected as exc:
+        # Nothing was spent: kept in the capture for replay, but not metered
+        capture_request(client, payload, options, 429, started, None)
+        raise HTTPException(
+            status_code=429,
+            detail=f"Service busy: {exc}",
+            headers={"Retry-After": str(exc.retry_after)},
+        ) from exc
     except RuntimeError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
     except Exception as exc:  # pragma: no cover - unexpected errors
         raise HTTPException(status_code=500, detail=f"Unexpected error: {exc}") from exc
 
+    if session is not None and not options.dry_run:
+        sessions.record(
+            session,
+            Turn(
+                question=result.question,
+                action=result.action,
+                sql=result.sql,
+                row_count=result.row_count,
+                columns=result.columns,
+            ),
+            # Pin only a complete snapshot; a degraded one is retried on the next turn
+            result.schema_prompt if result.schema_complete else None,
+        )
+
+    for resource, waited in ticket.waits.items():
+        response.headers[f"X-Queue-Wait-{resource.upper()}-Ms"] = f"{1000 * waited:.0f}"
+
     return AskResponse(
         answer=result.answer,
         sql=result.sql,
@@ -93,4 +295,7 @@ def ask_endpoint(payload: AskRequest) -> AskResponse:
         row_count=result.row_count,
         rows=result.rows,
         schema_prompt=result.schema_prompt,
+        profile=result.profile,
+        session_id=session.id if session is not None else None,
+        usage=result.usage,
     )
@@ -0,0 +1,81 @@
+"""
+sessions.py — In-memory conversational sessions for the ask service
+
+A session keeps the first complete schema snapshot it got plus a compact list of
+previous turns (question, final SQL, result shape). Reusing the same snapshot
+keeps the prompt prefix byte-identical across turns, so follow-up questions
+only prefill the incremental part on the LLM server.
+"""
+from __future__ import annotations
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from .ask import Turn
+
+
+@dataclass
+class Session:
+    id: str
+    tables: Optional[List[str]] = None
+    schema_prompt: Optional[str] = None
+    turns: List[Turn] = field(default_factory=list)
+    created: float = field(default_factory=time.time)
+    updated: float = field(default_factory=time.time)
+
+
+class SessionStore:
+    """Thread-safe LRU of sessions with idle expiry."""
+
+    def __init__(self, max_sessions: int = 1000, ttl: float = 3600.0, max_turns: int = 6) -> None:
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_turns = max_turns
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+
+    def _expire(self, now: float) -> None:
+        # Every access refreshes `updated` and moves the session to the end, so the
+        # head is always the longest idle one
+        while self._sessions:
+            sid, oldest = next(iter(self._sessions.items()))
+            if now - oldest.updated <= self.ttl and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[sid]
+
+    def create(self, tables: Optional[List[str]] = None) -> Session:
+        session = Session(id=uuid.uuid4().hex, tables=tables)
+        with self._lock:
+            self._sessions[session.id] = session
+            self._expire(time.time())
+        return session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            now = time.time()
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.updated = now
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def record(self, session: Session, turn: Turn, schema_prompt: Optional[str]) -> None:
+        with self._lock:
+            if schema_prompt is not None:
+                session.schema_prompt = schema_prompt
+            session.turns.append(turn)
+            # Keep the window compact; older turns fall off the front
+            if len(session.turns) > self.max_turns:
+                del session.turns[: len(session.turns) - self.max_turns]
+            session.updated = time.time()
+            if session.id in self._sessions:
+                self._sessions.move_to_end(session.id)
@@ -0,0 +1,112 @@
+"""
+usage.py — Token accounting across requests for the ask service
+
+`TokenMeter` aggregates the per-request usage reported by `Trace.usage()`
+(overall, per model, per stage and per client) and enforces an optional
+per-client token budget over a sliding window. Clients idle for longer than
+the window are dropped, so per-client state stays bounded by recent traffic.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+
+class TokenMeter:
+    def __init__(self, client_budget: int = 0, window: float = 3600.0) -> None:
+        self.client_budget = client_budget  # tokens per client per window; 0 disables
+        self.window = window
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._totals: Dict[str, float] = defaultdict(int)
+        self._by_model: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(int))
+        self._by_stage: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(int))
+        # Plain dicts: lookups for unknown clients must not create entries
+        self._by_client: Dict[str, Dict[str, float]] = {}
+        self._recent: Dict[str, Deque[Tuple[float, int]]] = {}
+        self._last_prune = time.time()
+
+    def _window_used(self, client: str, now: float) -> int:
+        recent = self._recent.get(client)
+        if recent is None:
+            return 0
+        while recent and now - recent[0][0] > self.window:
+            recent.popleft()
+        if not recent:
+            del self._recent[client]
+            return 0
+        return sum(tokens for _, tokens in recent)
+
+    def _prune(self, now: float) -> None:
+        # At most once per minute (or window): drop clients idle for a whole window
+        if now - self._last_prune < min(self.window, 60.0):
+            return
+        self._last_prune = now
+        for client in [c for c, stats in self._by_client.items() if now - stats["last_seen"] > self.window]:
+            del self._by_client[client]
+            self._recent.pop(client, None)
+
+    def remaining(self, client: str) -> Optional[int]:
+        """Tokens left for `client` in the current window; None when unlimited."""
+        if self.client_budget <= 0:
+            return None
+        with self._lock:
+            return max(0, self.client_budget - self._window_used(client, time.time()))
+
+    def retry_after(self, client: str) -> int:
+        """Seconds until the oldest usage of `client` leaves the window."""
+        with self._lock:
+            recent = self._recent.get(client)
+            if not recent:
+                return 1
+            return max(1, int(recent[0][0] + self.window - time.time()) + 1)
+
+    def record(self, client: str, usage: Dict[str, Any]) -> None:
+        total = int(usage.get("total_tokens") or 0)
+        now = time.time()
+        with self._lock:
+            self._requests += 1
+            for key in ("prompt_tokens", "completion_tokens", "total_tokens", "llm_calls", "llm_latency"):
+                self._totals[key] += usage.get(key) or 0
+            for model, stats in (usage.get("by_model") or {}).items():
+                self._by_model[model]["requests"] += 1
+                for key, value in stats.items():
+                    self._by_model[model][key] += value or 0
+            for stage, stats in (usage.get("by_stage") or {}).items():
+                for key, value in stats.items():
+                    self._by_stage[stage][key] += value or 0
+            client_stats = self._by_client.setdefault(client, {"requests": 0, "total_tokens": 0})
+            client_stats["requests"] += 1
+            client_stats["total_tokens"] += total
+            client_stats["last_seen"] = now
+            if usage.get("skipped"):
+                self._totals["downgraded_requests"] += 1
+            if total:
+                self._recent.setdefault(client, deque()).append((now, total))
+            self._prune(now)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.time()
+            clients = {
+                client: {
+                    "requests": stats["requests"],
+                    "total_tokens": stats["total_tokens"],
+                    "window_tokens": self._window_used(client, now),
+                }
+                for client, stats in sorted(
+                    self._by_client.items(), key=lambda kv: kv[1]["total_tokens"], reverse=True
+                )[:20]
+            }
+            return {
+                "requests": self._requests,
+                "totals": dict(self._totals),
+                "by_model": {m: {k: round(v, 4) for k, v in stats.items()} for m, stats in self._by_model.items()},
+                "by_stage": {s: {k: round(v, 4) for k, v in stats.items()} for s, stats in self._by_stage.items()},
+                "active_clients": len(self._by_client),
+                "top_clients": clients,
+                "client_budget": self.client_budget or None,
+                "window": self.window,
+            }